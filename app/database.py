@@ -7,6 +7,7 @@ from sqlalchemy.orm import sessionmaker
 from app.models import Base, init_database
 from app.config import settings
 import logging
+import orjson
 
 logger = logging.getLogger(__name__)
 
@@ -16,8 +17,14 @@ def initialize_database():
     This should be run once when setting up the application.
     """
     try:
-        # Create database engine
-        engine = create_engine(settings.database_url, echo=settings.debug)
+        # Create database engine (statement echo is costly per statement,
+        # so it is gated behind its own flag rather than general debug)
+        engine = create_engine(
+            settings.database_url,
+            echo=settings.sql_echo,
+            json_serializer=lambda value: orjson.dumps(value).decode(),
+            json_deserializer=orjson.loads
+        )
         
         # Create all tables
         logger.info("Creating database tables...")
@@ -37,7 +44,11 @@ def get_database_session():
     """
     Get a database session for use in the application.
     """
-    engine = create_engine(settings.database_url)
+    engine = create_engine(
+        settings.database_url,
+        json_serializer=lambda value: orjson.dumps(value).decode(),
+        json_deserializer=orjson.loads
+    )
     SessionLocal = sessionmaker(bind=engine)
     return SessionLocal()
 
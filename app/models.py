@@ -2,11 +2,12 @@
 Core models for the Real-Jobs application using SQLAlchemy ORM.
 """
 
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Boolean, Float, ForeignKey, Index
+from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Boolean, Float, ForeignKey, Index, UniqueConstraint, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from datetime import datetime
+import orjson
 import uuid
 
 Base = declarative_base()
@@ -21,6 +22,8 @@ class Company(Base):
     careers_url = Column(String(500))
     ats_provider = Column(String(100))  # e.g., 'workday', 'greenhouse', 'lever'
     extraction_rules = Column(JSONB)  # Cached extraction rules for this company
+    etag = Column(String(255))  # ETag of the careers page at last crawl
+    last_modified = Column(String(255))  # Last-Modified header at last crawl
     last_crawled = Column(DateTime)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -34,6 +37,19 @@ class Company(Base):
     __table_args__ = (
         Index('idx_company_domain', domain),
         Index('idx_company_name', name),
+        Index(
+            'idx_company_extraction_rules_gin',
+            extraction_rules,
+            postgresql_using='gin',
+            postgresql_ops={'extraction_rules': 'jsonb_path_ops'}
+        ),
+        # Partial index covering the crawl_all_companies scan so it runs
+        # as an index-only scan instead of a sequential scan
+        Index(
+            'idx_company_active_careers',
+            id, name,
+            postgresql_where=text("is_active = true AND careers_url IS NOT NULL")
+        ),
     )
 
 class Job(Base):
@@ -68,11 +84,19 @@ class Job(Base):
     
     # Indexes
     __table_args__ = (
-        Index('idx_job_company_id', company_id),
+        # Backs the dedup lookup (company_id, external_id) with a single
+        # index scan and enables ON CONFLICT upserts; makes the old
+        # single-column company_id/external_id indexes redundant
+        UniqueConstraint('company_id', 'external_id', name='uq_job_company_external'),
         Index('idx_job_title', title),
         Index('idx_job_location', location),
         Index('idx_job_posted_date', posted_date),
-        Index('idx_job_external_id', external_id),
+        Index(
+            'idx_job_raw_data_gin',
+            raw_data,
+            postgresql_using='gin',
+            postgresql_ops={'raw_data': 'jsonb_path_ops'}
+        ),
     )
 
 class CrawlLog(Base):
@@ -89,7 +113,9 @@ class CrawlLog(Base):
     jobs_new = Column(Integer, default=0)
     jobs_updated = Column(Integer, default=0)
     error_message = Column(Text)
-    metadata = Column(JSONB)  # Store additional crawl information
+    # Named 'meta' on the class because 'metadata' is reserved by
+    # SQLAlchemy's declarative base; the DB column keeps the old name
+    meta = Column('metadata', JSONB)  # Store additional crawl information
     
     # Relationships
     company = relationship("Company", back_populates="crawl_logs")
@@ -119,14 +145,22 @@ class ExtractionRule(Base):
     
     # Indexes
     __table_args__ = (
-        Index('idx_extraction_rule_company_id', company_id),
+        # Backs ON CONFLICT upserts keyed on (company_id, rule_type) and
+        # the per-company rule lookups; makes the old single-column
+        # company_id index redundant
+        UniqueConstraint('company_id', 'rule_type', name='uq_extraction_rule_company_type'),
         Index('idx_extraction_rule_pattern', site_pattern),
     )
 
 # Database connection and session management
 def create_db_engine(database_url: str):
     """Create database engine."""
-    return create_engine(database_url, echo=False)
+    return create_engine(
+        database_url,
+        echo=False,
+        json_serializer=lambda value: orjson.dumps(value).decode(),
+        json_deserializer=orjson.loads
+    )
 
 def create_session_factory(engine):
     """Create session factory."""
@@ -10,7 +10,9 @@ CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
 -- Create indexes for better performance
 CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_companies_domain ON companies(domain);
 CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_companies_name ON companies(name);
-CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_jobs_company_id ON jobs(company_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_company_active_careers ON companies(id, name) WHERE is_active = true AND careers_url IS NOT NULL;
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_job_company_external ON jobs(company_id, external_id);
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_extraction_rule_company_type ON extraction_rules(company_id, rule_type);
 CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_jobs_title ON jobs(title);
 CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_jobs_location ON jobs(location);
 CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_jobs_posted_date ON jobs(posted_date);
@@ -19,6 +21,11 @@ CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_jobs_posted_date ON jobs(posted_date
 CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_jobs_title_fts ON jobs USING gin(to_tsvector('english', title));
 CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_jobs_description_fts ON jobs USING gin(to_tsvector('english', description));
 
+-- Create GIN indexes for JSONB containment lookups (jsonb_path_ops is
+-- smaller and faster than the default opclass for @> queries)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_company_extraction_rules_gin ON companies USING gin(extraction_rules jsonb_path_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_job_raw_data_gin ON jobs USING gin(raw_data jsonb_path_ops);
+
 -- Create composite indexes for common queries
 CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_jobs_active_posted ON jobs(is_active, posted_date DESC);
 CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_crawl_logs_company_status ON crawl_logs(company_id, status, started_at DESC);
\ No newline at end of file
@@ -0,0 +1,54 @@
+"""
+Shared database engine and session factory for Celery tasks.
+"""
+
+from functools import cache
+from celery.signals import worker_process_init
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.config import settings
+import orjson
+
+@cache
+def get_engine():
+    """
+    Engine (and connection pool) for the current process, built lazily on
+    first use. Lazy construction means a forked worker that never touched
+    the parent's engine builds its own pool from scratch, and tasks reuse
+    warm connections instead of rebuilding an engine per invocation.
+    """
+    return create_engine(
+        settings.database_url,
+        pool_size=10,
+        max_overflow=5,
+        # Workers are long-lived and idle connections get reaped server-side;
+        # pre-ping plus recycling avoids OperationalError on first use after idle
+        pool_pre_ping=True,
+        pool_recycle=300,
+        json_serializer=lambda value: orjson.dumps(value).decode(),
+        json_deserializer=orjson.loads
+    )
+
+@cache
+def get_session_factory():
+    """
+    Session factory bound to the per-process engine. expire_on_commit is
+    off because tasks read object attributes after their final commit to
+    build result payloads; the default would re-SELECT every object on
+    first access. autoflush is off so queries issued mid-task never
+    interleave pending writes into the transaction; tasks flush once at
+    commit time.
+    """
+    return sessionmaker(bind=get_engine(), expire_on_commit=False, autoflush=False)
+
+def get_session():
+    """Open a new session on the per-process engine."""
+    return get_session_factory()()
+
+@worker_process_init.connect
+def _dispose_engine_on_fork(**kwargs):
+    """
+    Drop connections inherited from the parent process after a worker
+    forks, so pooled connections are never shared across processes.
+    """
+    get_engine().dispose()
@@ -2,15 +2,15 @@
 Tasks for job extraction and processing.
 """
 
-from celery import current_task
-from sqlalchemy.orm import sessionmaker
+from celery import current_task, group
+from sqlalchemy import insert, select, update
 from scrapper.celery_app import celery_app
 from scrapper.workflow import JobScrapingWorkflow
-from app.models import Company, Job, CrawlLog, create_db_engine
-from app.config import settings
+from scrapper.db import get_session
+from app.models import Company, Job, CrawlLog
 from datetime import datetime
 import logging
-import hashlib
+import xxhash
 
 logger = logging.getLogger(__name__)
 
@@ -19,9 +19,7 @@ def extract_company_jobs(self, company_id: str):
     """
     Extract jobs for a specific company using stored extraction rules.
     """
-    engine = create_db_engine(settings.database_url)
-    SessionLocal = sessionmaker(bind=engine)
-    db = SessionLocal()
+    db = get_session()
     
     try:
         # Get company
@@ -49,56 +47,92 @@ def extract_company_jobs(self, company_id: str):
             meta={'step': 'extracting', 'company': company.name}
         )
         
-        # Run extraction workflow
-        workflow = JobScrapingWorkflow()
-        result = workflow.run_crawl(
-            company_name=company.name,
-            company_domain=company.domain,
-            careers_url=company.careers_url
-        )
+        # Run extraction workflow; close the pooled HTTP client when done
+        with JobScrapingWorkflow() as workflow:
+            result = workflow.run_crawl(
+                company_name=company.name,
+                company_domain=company.domain,
+                careers_url=company.careers_url
+            )
         
         jobs_new = 0
         jobs_updated = 0
-        
-        # Process extracted jobs
+        new_rows = []
+        update_rows = []
+
+        # One timestamp for the whole batch instead of a utcnow() call
+        # per row
+        now = datetime.utcnow()
+
+        # Compute all dedup hashes up front so existing jobs can be
+        # fetched with a single query instead of one SELECT per listing.
+        # The company UUID is stringified once instead of per listing.
+        hash_seed = f"{company.id}:".encode()
+        job_hashes = []
         for job_data in result.job_listings:
-            # Create a hash for deduplication
-            job_hash = hashlib.md5(
-                f"{company.id}:{job_data.get('title', '')}:{job_data.get('location', '')}".encode()
-            ).hexdigest()
-            
+            hasher = xxhash.xxh3_64(hash_seed)
+            hasher.update((job_data.get('title') or '').encode())
+            hasher.update(b":")
+            hasher.update((job_data.get('location') or '').encode())
+            job_hashes.append(hasher.hexdigest())
+        existing_jobs = {}
+        if job_hashes:
+            existing_jobs = {
+                job.external_id: job
+                for job in db.query(Job).filter(
+                    Job.company_id == company.id,
+                    Job.external_id.in_(job_hashes)
+                ).all()
+            }
+
+        # Process extracted jobs
+        seen_hashes = set()
+        for job_data, job_hash in zip(result.job_listings, job_hashes):
+            # Skip duplicate listings on the same page so the bulk INSERT
+            # cannot violate the (company_id, external_id) constraint
+            if job_hash in seen_hashes:
+                continue
+            seen_hashes.add(job_hash)
+
             # Check if job already exists
-            existing_job = db.query(Job).filter(
-                Job.company_id == company.id,
-                Job.external_id == job_hash
-            ).first()
-            
+            existing_job = existing_jobs.get(job_hash)
+
             if existing_job:
-                # Update existing job
-                existing_job.title = job_data.get('title', existing_job.title)
-                existing_job.location = job_data.get('location', existing_job.location)
-                existing_job.department = job_data.get('department', existing_job.department)
-                existing_job.url = job_data.get('url', existing_job.url)
-                existing_job.updated_at = datetime.utcnow()
-                existing_job.raw_data = job_data
+                # Queue changed columns for a single bulk UPDATE by primary key
+                update_rows.append({
+                    'id': existing_job.id,
+                    'title': job_data.get('title', existing_job.title),
+                    'location': job_data.get('location', existing_job.location),
+                    'department': job_data.get('department', existing_job.department),
+                    'url': job_data.get('url', existing_job.url),
+                    'updated_at': now,
+                    'raw_data': job_data
+                })
                 jobs_updated += 1
             else:
-                # Create new job
-                new_job = Job(
-                    company_id=company.id,
-                    external_id=job_hash,
-                    title=job_data.get('title', ''),
-                    location=job_data.get('location', ''),
-                    department=job_data.get('department', ''),
-                    url=job_data.get('url', ''),
-                    posted_date=datetime.utcnow(),
-                    raw_data=job_data
-                )
-                db.add(new_job)
+                # Queue new job for a single bulk INSERT after the loop
+                new_rows.append({
+                    'company_id': company.id,
+                    'external_id': job_hash,
+                    'title': job_data.get('title', ''),
+                    'location': job_data.get('location', ''),
+                    'department': job_data.get('department', ''),
+                    'url': job_data.get('url', ''),
+                    'posted_date': now,
+                    'raw_data': job_data
+                })
                 jobs_new += 1
-        
+
+        # Insert all new jobs in one statement instead of one INSERT per row
+        if new_rows:
+            db.execute(insert(Job), new_rows)
+
+        # Flush all updates as one executemany instead of per-row UPDATEs
+        if update_rows:
+            db.execute(update(Job), update_rows)
+
         # Update company last crawled
-        company.last_crawled = datetime.utcnow()
+        company.last_crawled = now
         
         # Update crawl log
         crawl_log.status = 'success' if not result.error_message else 'failed'
@@ -107,7 +141,7 @@ def extract_company_jobs(self, company_id: str):
         crawl_log.jobs_new = jobs_new
         crawl_log.jobs_updated = jobs_updated
         crawl_log.error_message = result.error_message
-        crawl_log.metadata = {
+        crawl_log.meta = {
             'confidence_score': result.confidence_score,
             'extraction_rules': result.extraction_rules
         }
@@ -127,8 +161,12 @@ def extract_company_jobs(self, company_id: str):
     except Exception as e:
         logger.error(f"Job extraction failed for company {company_id}: {str(e)}")
         
-        # Update crawl log with error
+        # Update crawl log with error; the failed transaction (e.g. a
+        # unique-constraint violation from a concurrent crawl of the
+        # same company) must be rolled back before the session can
+        # write again
         if 'crawl_log' in locals():
+            db.rollback()
             crawl_log.status = 'failed'
             crawl_log.completed_at = datetime.utcnow()
             crawl_log.error_message = str(e)
@@ -144,39 +182,40 @@ def crawl_all_companies():
     """
     Crawl jobs from all active companies.
     """
-    engine = create_db_engine(settings.database_url)
-    SessionLocal = sessionmaker(bind=engine)
-    db = SessionLocal()
+    db = get_session()
     
     try:
-        # Get all active companies with careers URLs
-        companies = db.query(Company).filter(
-            Company.is_active == True,
-            Company.careers_url.isnot(None)
-        ).all()
-        
-        results = []
-        
-        for company in companies:
-            try:
-                # Queue job extraction task
-                result = extract_company_jobs.delay(str(company.id))
-                results.append({
-                    'company_id': str(company.id),
-                    'company_name': company.name,
-                    'task_id': result.id
-                })
-            except Exception as e:
-                logger.error(f"Failed to queue extraction for {company.name}: {str(e)}")
-                results.append({
-                    'company_id': str(company.id),
-                    'company_name': company.name,
-                    'error': str(e)
-                })
-        
+        # Stream only the two columns the fanout needs; full Company rows
+        # would deserialize the extraction_rules JSONB for nothing
+        companies = db.execute(
+            select(Company.id, Company.name)
+            .where(
+                Company.is_active == True,
+                Company.careers_url.isnot(None)
+            )
+            .execution_options(yield_per=500)
+        )
+
+        company_rows = [(str(company_id), company_name) for company_id, company_name in companies]
+
+        # Publish the whole fanout as one celery group instead of paying
+        # a broker round-trip per .delay() call
+        group_result = group(
+            extract_company_jobs.s(company_id) for company_id, _ in company_rows
+        ).apply_async()
+
+        results = [
+            {
+                'company_id': company_id,
+                'company_name': company_name,
+                'task_id': child.id
+            }
+            for (company_id, company_name), child in zip(company_rows, group_result.children or [])
+        ]
+
         return {
-            'total_companies': len(companies),
-            'queued_tasks': len([r for r in results if 'task_id' in r]),
+            'total_companies': len(company_rows),
+            'queued_tasks': len(results),
             'results': results
         }
         
@@ -188,9 +227,7 @@ def extract_job_details(self, job_id: str):
     """
     Extract detailed information for a specific job posting.
     """
-    engine = create_db_engine(settings.database_url)
-    SessionLocal = sessionmaker(bind=engine)
-    db = SessionLocal()
+    db = get_session()
     
     try:
         job = db.query(Job).filter(Job.id == job_id).first()
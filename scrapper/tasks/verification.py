@@ -3,24 +3,62 @@ Tasks for verifying and improving extraction rules.
 """
 
 from celery import current_task
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import case, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from scrapper.celery_app import celery_app
 from scrapper.workflow import JobScrapingWorkflow
-from app.models import Company, ExtractionRule, create_db_engine
-from app.config import settings
+from scrapper.db import get_session
+from app.models import Company, ExtractionRule
 from datetime import datetime, timedelta
 import logging
+import uuid
 
 logger = logging.getLogger(__name__)
 
+def upsert_extraction_rules(db, rows):
+    """
+    Upsert extraction-rule rows with a single INSERT ... ON CONFLICT DO
+    UPDATE keyed on (company_id, rule_type), so persisting a batch never
+    needs a preliminary SELECT to decide between INSERT and UPDATE.
+    """
+    if not rows:
+        return
+
+    stmt = pg_insert(ExtractionRule).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['company_id', 'rule_type'],
+        set_={
+            'site_pattern': stmt.excluded.site_pattern,
+            'selectors': stmt.excluded.selectors,
+            'confidence_score': stmt.excluded.confidence_score,
+            'last_verified': stmt.excluded.last_verified,
+            'updated_at': stmt.excluded.last_verified,
+            # Weighted average with the previous success rate, computed
+            # server-side against the conflicting row; callers pass a
+            # zero success_rate when no jobs were extracted, which
+            # leaves the old rate untouched
+            'success_rate': case(
+                (
+                    stmt.excluded.success_rate > 0,
+                    func.coalesce(ExtractionRule.success_rate, 0.0) * 0.7
+                    + stmt.excluded.success_rate * 0.3,
+                ),
+                else_=ExtractionRule.success_rate,
+            ),
+        },
+    )
+    db.execute(stmt)
+
 @celery_app.task(bind=True)
 def verify_extraction_rules(self, company_id: str = None):
     """
     Verify and update extraction rules for companies.
+
+    Hands the whole company window to a crawl subtask that batches the
+    LLM round-trips, then persists all results in a single callback with
+    one commit.
     """
-    engine = create_db_engine(settings.database_url)
-    SessionLocal = sessionmaker(bind=engine)
-    db = SessionLocal()
+    db = get_session()
     
     try:
         # Get companies to verify
@@ -35,83 +73,163 @@ def verify_extraction_rules(self, company_id: str = None):
                 (Company.last_crawled.is_(None) | (Company.last_crawled < cutoff_date))
             ).limit(10).all()  # Limit to avoid overloading
         
-        results = []
-        
-        for company in companies:
-            try:
-                # Update task progress
-                current_task.update_state(
-                    state='PROGRESS',
-                    meta={'step': 'verifying', 'company': company.name}
-                )
-                
-                # Run verification workflow
-                workflow = JobScrapingWorkflow()
-                result = workflow.run_crawl(
-                    company_name=company.name,
-                    company_domain=company.domain,
-                    careers_url=company.careers_url
-                )
-                
-                # Calculate success metrics
-                jobs_extracted = len(result.job_listings)
-                confidence_score = result.confidence_score
-                
-                # Update or create extraction rule
-                if result.extraction_rules:
-                    existing_rule = db.query(ExtractionRule).filter(
-                        ExtractionRule.company_id == company.id,
-                        ExtractionRule.rule_type == 'job_list'
-                    ).first()
-                    
-                    if existing_rule:
-                        # Update existing rule
-                        existing_rule.selectors = result.extraction_rules
-                        existing_rule.confidence_score = confidence_score
-                        existing_rule.last_verified = datetime.utcnow()
-                        
-                        # Update success rate based on extraction results
-                        if jobs_extracted > 0:
-                            # Weighted average with previous success rate
-                            old_rate = existing_rule.success_rate or 0.0
-                            new_rate = min(confidence_score, 1.0)
-                            existing_rule.success_rate = (old_rate * 0.7) + (new_rate * 0.3)
-                        
-                    else:
-                        # Create new rule
-                        new_rule = ExtractionRule(
-                            company_id=company.id,
-                            site_pattern=company.careers_url,
-                            rule_type='job_list',
-                            selectors=result.extraction_rules,
-                            confidence_score=confidence_score,
-                            success_rate=min(confidence_score, 1.0),
-                            last_verified=datetime.utcnow()
-                        )
-                        db.add(new_rule)
-                
-                # Update company extraction rules cache
-                company.extraction_rules = result.extraction_rules
-                company.last_crawled = datetime.utcnow()
-                
-                results.append({
-                    'company_id': str(company.id),
-                    'company_name': company.name,
-                    'jobs_extracted': jobs_extracted,
-                    'confidence_score': confidence_score,
-                    'status': 'success' if not result.error_message else 'failed',
-                    'error_message': result.error_message
-                })
-                
-            except Exception as e:
-                logger.error(f"Verification failed for {company.name}: {str(e)}")
-                results.append({
-                    'company_id': str(company.id),
-                    'company_name': company.name,
-                    'status': 'error',
-                    'error_message': str(e)
-                })
+        # Lightweight payloads so the subtasks never touch the session
+        payloads = [
+            {
+                'id': str(company.id),
+                'name': company.name,
+                'domain': company.domain,
+                'careers_url': company.careers_url,
+                'etag': company.etag,
+                'last_modified': company.last_modified
+            }
+            for company in companies
+        ]
+
+        if not payloads:
+            return {
+                'companies_verified': 0,
+                'successful_verifications': 0,
+                'results': []
+            }
+
+        job = (
+            _verify_companies.s(payloads) | _persist_verification_results.s()
+        ).apply_async()
+
+        return {
+            'companies_queued': len(payloads),
+            'callback_task_id': job.id
+        }
+        
+    except Exception as e:
+        logger.error(f"Batch verification failed: {str(e)}")
+        raise
         
+    finally:
+        db.close()
+
+@celery_app.task(bind=True)
+def _verify_companies(self, company_payloads: list):
+    """
+    Crawl a window of companies with one workflow instance so every
+    rule-generation prompt goes out in a single batched LLM call, and
+    return the per-company results for the persistence callback.
+    """
+    current_task.update_state(
+        state='PROGRESS',
+        meta={'step': 'verifying', 'companies': len(company_payloads)}
+    )
+
+    with JobScrapingWorkflow() as workflow:
+        states = workflow.run_batch(company_payloads)
+
+    results = []
+    for payload, state in zip(company_payloads, states):
+        if state.error_message and not state.extraction_rules:
+            results.append({
+                'company_id': payload['id'],
+                'company_name': payload['name'],
+                'status': 'error',
+                'error_message': state.error_message
+            })
+            continue
+
+        if state.step == 'not_modified':
+            # Page unchanged since the last crawl; the cached rules stay
+            results.append({
+                'company_id': payload['id'],
+                'company_name': payload['name'],
+                'status': 'success',
+                'not_modified': True,
+                'error_message': None
+            })
+            continue
+
+        results.append({
+            'company_id': payload['id'],
+            'company_name': payload['name'],
+            'careers_url': payload['careers_url'],
+            'jobs_extracted': len(state.job_listings),
+            'confidence_score': state.confidence_score,
+            'extraction_rules': state.extraction_rules,
+            'etag': state.etag,
+            'last_modified': state.last_modified,
+            'status': 'success' if not state.error_message else 'failed',
+            'error_message': state.error_message
+        })
+
+    return results
+
+@celery_app.task
+def _persist_verification_results(results: list):
+    """
+    Chord callback: persist every verification result with one session
+    and a single commit.
+    """
+    db = get_session()
+
+    try:
+        company_ids = [uuid.UUID(result['company_id']) for result in results]
+
+        companies = {
+            company.id: company
+            for company in db.query(Company).filter(Company.id.in_(company_ids)).all()
+        }
+
+        rule_rows = []
+
+        # Keep the loop read-only on the wire: no_autoflush guarantees
+        # nothing hits the database until the explicit flush below, so
+        # the transaction becomes one sequential write burst at the end
+        with db.no_autoflush:
+            for result in results:
+                cid = uuid.UUID(result['company_id'])
+
+                if result.get('not_modified'):
+                    # Nothing changed upstream; just record the visit
+                    company = companies.get(cid)
+                    if company:
+                        company.last_crawled = datetime.utcnow()
+                    continue
+
+                extraction_rules = result.get('extraction_rules')
+                confidence_score = result.get('confidence_score', 0.0)
+
+                # Queue the rule for one batched upsert after the loop; the
+                # unique (company_id, rule_type) key decides server-side
+                # whether this inserts or updates. A run that extracted
+                # no jobs contributes a zero success rate so the upsert
+                # never pulls the stored rate toward a confidence score
+                # the extraction did not back up
+                if extraction_rules:
+                    new_rate = (
+                        min(confidence_score, 1.0)
+                        if result.get('jobs_extracted', 0) > 0
+                        else 0.0
+                    )
+                    rule_rows.append({
+                        'company_id': cid,
+                        'site_pattern': result.get('careers_url'),
+                        'rule_type': 'job_list',
+                        'selectors': extraction_rules,
+                        'confidence_score': confidence_score,
+                        'success_rate': new_rate,
+                        'last_verified': datetime.utcnow()
+                    })
+
+                # Update company extraction rules cache and page validators
+                company = companies.get(cid)
+                if company and result['status'] != 'error':
+                    company.extraction_rules = extraction_rules
+                    company.etag = result.get('etag')
+                    company.last_modified = result.get('last_modified')
+                    company.last_crawled = datetime.utcnow()
+
+        # One round-trip upserts every rule in the batch
+        upsert_extraction_rules(db, rule_rows)
+
+        db.flush()
         db.commit()
         
         return {
@@ -120,10 +238,6 @@ def verify_extraction_rules(self, company_id: str = None):
             'results': results
         }
         
-    except Exception as e:
-        logger.error(f"Batch verification failed: {str(e)}")
-        raise
-        
     finally:
         db.close()
 
@@ -132,9 +246,7 @@ def improve_extraction_rules(self, company_id: str):
     """
     Use LLM to improve extraction rules based on recent performance.
     """
-    engine = create_db_engine(settings.database_url)
-    SessionLocal = sessionmaker(bind=engine)
-    db = SessionLocal()
+    db = get_session()
     
     try:
         company = db.query(Company).filter(Company.id == company_id).first()
@@ -157,34 +269,32 @@ def improve_extraction_rules(self, company_id: str):
             meta={'step': 'improving_rules', 'company': company.name}
         )
         
-        # Run workflow to generate new rules
-        workflow = JobScrapingWorkflow()
-        result = workflow.run_crawl(
-            company_name=company.name,
-            company_domain=company.domain,
-            careers_url=company.careers_url
-        )
+        # Run workflow to generate new rules; close the pooled HTTP
+        # client when the crawl finishes
+        with JobScrapingWorkflow() as workflow:
+            result = workflow.run_crawl(
+                company_name=company.name,
+                company_domain=company.domain,
+                careers_url=company.careers_url
+            )
         
         # Compare performance with existing rules
         new_confidence = result.confidence_score
         best_existing_confidence = max(rule.confidence_score for rule in current_rules)
         
         if new_confidence > best_existing_confidence * 1.1:  # 10% improvement threshold
-            # Deactivate old rules
-            for rule in current_rules:
-                rule.is_active = False
-            
-            # Create new improved rule
-            improved_rule = ExtractionRule(
-                company_id=company.id,
-                site_pattern=company.careers_url,
-                rule_type='job_list',
-                selectors=result.extraction_rules,
-                confidence_score=new_confidence,
-                success_rate=new_confidence,
-                last_verified=datetime.utcnow()
-            )
-            db.add(improved_rule)
+            # Replace the stored rule in place via the shared upsert;
+            # the unique (company_id, rule_type) key means improvements
+            # no longer keep superseded rules around as inactive rows
+            upsert_extraction_rules(db, [{
+                'company_id': company.id,
+                'site_pattern': company.careers_url,
+                'rule_type': 'job_list',
+                'selectors': result.extraction_rules,
+                'confidence_score': new_confidence,
+                'success_rate': new_confidence,
+                'last_verified': datetime.utcnow()
+            }])
             
             # Update company cache
             company.extraction_rules = result.extraction_rules
@@ -220,24 +330,18 @@ def cleanup_old_extraction_rules():
     """
     Clean up old, unused extraction rules to keep the database tidy.
     """
-    engine = create_db_engine(settings.database_url)
-    SessionLocal = sessionmaker(bind=engine)
-    db = SessionLocal()
+    db = get_session()
     
     try:
-        # Delete rules older than 90 days that are inactive
+        # Delete rules older than 90 days that are inactive with a single
+        # bulk DELETE instead of loading and deleting them row by row
         cutoff_date = datetime.utcnow() - timedelta(days=90)
-        
-        old_rules = db.query(ExtractionRule).filter(
+
+        deleted_count = db.query(ExtractionRule).filter(
             ExtractionRule.is_active == False,
             ExtractionRule.last_verified < cutoff_date
-        ).all()
-        
-        deleted_count = len(old_rules)
-        
-        for rule in old_rules:
-            db.delete(rule)
-        
+        ).delete(synchronize_session=False)
+
         db.commit()
         
         return {
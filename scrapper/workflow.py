@@ -2,25 +2,226 @@
 LangGraph workflow for intelligent job scraping.
 """
 
+from dataclasses import dataclass, field
 from typing import Dict, List, Any, Optional
 from langgraph.graph import StateGraph, END
-from langchain_core.pydantic_v1 import BaseModel, Field
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
+import asyncio
 import httpx
+import soupsieve
 from bs4 import BeautifulSoup
-import json
+from lxml import etree
+import orjson
 import re
 from urllib.parse import urljoin, urlparse
 from app.config import settings
 
-class CrawlState(BaseModel):
-    """State for the crawling workflow."""
+# Browser-like headers shared by every outbound request
+DEFAULT_HEADERS = {
+    "User-Agent": settings.default_user_agent,
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.5",
+    "Accept-Encoding": "gzip, deflate",
+    "Connection": "keep-alive",
+}
+
+# Selectors and patterns compiled once at import so each crawl walks the
+# DOM a single time instead of once per probe
+_JOB_CONTAINER_SELECTOR = soupsieve.compile(", ".join([
+    "[class*='job']",
+    "[class*='position']",
+    "[class*='opening']",
+    "[data-testid*='job']",
+    ".career-listing",
+    ".job-listing",
+    ".position-listing"
+]))
+_FILTER_SELECTOR = soupsieve.compile("[class*='filter'], [class*='search']")
+_PAGINATION_RE = re.compile(r'next|more|page', re.I)
+
+# Prompt templates are parsed once at import instead of per invocation
+_EXTRACTION_PROMPT = ChatPromptTemplate.from_template("""
+You are an expert web scraper. Analyze the following HTML from a company careers page and generate CSS selectors to extract job listings.
+
+Company: {company_name}
+URL: {careers_url}
+
+HTML Sample:
+{html_sample}
+
+Please provide a JSON response with the following structure:
+{{
+    "job_list_selector": "CSS selector for the container holding all jobs",
+    "job_item_selector": "CSS selector for individual job items",
+    "title_selector": "CSS selector for job title (relative to job item)",
+    "location_selector": "CSS selector for job location (relative to job item)",
+    "department_selector": "CSS selector for department (relative to job item)",
+    "link_selector": "CSS selector for job detail link (relative to job item)",
+    "confidence_score": 0.8,
+    "notes": "Any additional observations"
+}}
+
+Focus on finding reliable, specific selectors that uniquely identify job-related elements.
+""")
+
+_DISCOVERY_PROMPT = ChatPromptTemplate.from_template("""
+Given the company name "{company_name}" and domain "{company_domain}", 
+what are the most likely URLs for their careers page?
+
+Provide 3-5 potential URLs in order of likelihood.
+Format as a simple list, one URL per line.
+""")
+
+# Common careers-page paths, in priority order
+COMMON_CAREERS_PATHS = [
+    "/careers",
+    "/jobs",
+    "/work-with-us",
+    "/join-us",
+    "/opportunities"
+]
+
+async def _probe_careers_paths(domain: str) -> Optional[str]:
+    """
+    HEAD-probe every common careers path concurrently and return the
+    highest-priority URL that answers 200. Firing the probes in parallel
+    collapses worst-case latency from the sum of the round-trips to the
+    slowest one, and HEAD avoids downloading response bodies entirely.
+    """
+    urls = [f"https://{domain}{path}" for path in COMMON_CAREERS_PATHS]
+
+    async with httpx.AsyncClient(
+        http2=True,
+        headers=DEFAULT_HEADERS,
+        timeout=5,
+        follow_redirects=True
+    ) as client:
+        responses = await asyncio.gather(
+            *[client.head(url) for url in urls],
+            return_exceptions=True
+        )
+
+    for url, response in zip(urls, responses):
+        if not isinstance(response, BaseException) and response.status_code == 200:
+            return url
+    return None
+
+def _extract_json_object(s: str) -> Optional[str]:
+    """
+    Return the first balanced {...} object in s. A single forward scan
+    tracking brace depth and string state replaces the old greedy
+    re.DOTALL search, which backtracked badly on long LLM replies.
+    """
+    depth = 0
+    start = -1
+    in_string = False
+    escaped = False
+    for i, ch in enumerate(s):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch == '{':
+            if depth == 0:
+                start = i
+            depth += 1
+        elif ch == '}' and depth:
+            depth -= 1
+            if depth == 0:
+                return s[start:i + 1]
+    return None
+
+class _SampleBudgetReached(Exception):
+    """Raised by _SampleCollector once enough sample text is gathered."""
+
+class _SampleCollector:
+    """
+    SAX-style parser target that re-renders markup in document order,
+    skipping script/style subtrees, and aborts the parse as soon as the
+    sample budget is reached.
+    """
+
+    _SKIPPED_TAGS = ('script', 'style')
+
+    def __init__(self, max_chars: int):
+        self.max_chars = max_chars
+        self.parts = []
+        self.total = 0
+        self.skip_depth = 0
+
+    def _emit(self, token: str):
+        self.parts.append(token)
+        self.total += len(token)
+        if self.total >= self.max_chars:
+            raise _SampleBudgetReached
+
+    def start(self, tag, attrs):
+        if tag in self._SKIPPED_TAGS:
+            self.skip_depth += 1
+            return
+        if self.skip_depth:
+            return
+        attr_str = ''.join(
+            f' {name}="{value}"' if value is not None else f' {name}'
+            for name, value in attrs.items()
+        )
+        self._emit(f'<{tag}{attr_str}>')
+
+    def end(self, tag):
+        if tag in self._SKIPPED_TAGS:
+            self.skip_depth -= 1
+            return
+        if self.skip_depth:
+            return
+        self._emit(f'</{tag}>')
+
+    def data(self, text):
+        if not self.skip_depth and text.strip():
+            self._emit(text)
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        return ''.join(self.parts)
+
+def _clean_html_sample(html: str, max_chars: int = 8000) -> str:
+    """
+    Build a truncated, script/style-free sample of the page for the LLM
+    prompt. Streaming through a parser target avoids materializing a
+    full parse tree (and re-serializing the whole document) just to
+    throw most of it away.
+    """
+    collector = _SampleCollector(max_chars)
+    parser = etree.HTMLParser(target=collector)
+    try:
+        parser.feed(html)
+        parser.close()
+    except _SampleBudgetReached:
+        pass
+    return ''.join(collector.parts)[:max_chars]
+
+@dataclass(slots=True)
+class CrawlState:
+    """
+    State for the crawling workflow. A slotted dataclass instead of a
+    pydantic model: the nodes just mutate it in place, so there is no
+    need to re-validate every field on each hop through the graph.
+    """
     company_name: str
     company_domain: Optional[str] = None
     careers_url: Optional[str] = None
     html_content: Optional[str] = None
-    job_listings: List[Dict[str, Any]] = Field(default_factory=list)
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    job_listings: List[Dict[str, Any]] = field(default_factory=list)
     extraction_rules: Optional[Dict[str, Any]] = None
     error_message: Optional[str] = None
     confidence_score: float = 0.0
@@ -35,7 +236,41 @@ class JobScrapingWorkflow:
             api_key=settings.openai_api_key,
             temperature=0.1
         )
+        # One pooled HTTP/2 client for every probe and fetch in this
+        # workflow, so repeat requests to a host reuse the connection
+        # instead of paying TCP+TLS handshakes per call
+        self.http = httpx.Client(
+            http2=True,
+            headers=DEFAULT_HEADERS,
+            timeout=httpx.Timeout(settings.request_timeout),
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=50),
+            follow_redirects=True
+        )
+        # Single-slot parse-tree cache shared by the graph nodes
+        self._soup = None
+        self._soup_html = None
         self.graph = self._build_graph()
+
+    def _get_soup(self, html: str) -> BeautifulSoup:
+        """
+        Parse the page once per crawl and reuse the tree across nodes.
+        LangGraph may copy the state object between nodes, but the html
+        string itself is shared, so identity is a safe cache key.
+        """
+        if self._soup_html is not html:
+            self._soup = BeautifulSoup(html, 'lxml')
+            self._soup_html = html
+        return self._soup
+
+    def close(self):
+        """Release pooled HTTP connections."""
+        self.http.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
     
     def _build_graph(self) -> StateGraph:
         """Build the LangGraph workflow."""
@@ -54,7 +289,12 @@ class JobScrapingWorkflow:
         
         # Add edges
         workflow.add_edge("discover_careers_page", "fetch_content")
-        workflow.add_edge("fetch_content", "analyze_structure")
+        # A 304 response short-circuits the rest of the pipeline
+        workflow.add_conditional_edges(
+            "fetch_content",
+            lambda state: "skip" if state.step == "not_modified" else "continue",
+            {"skip": END, "continue": "analyze_structure"}
+        )
         workflow.add_edge("analyze_structure", "generate_extraction_rules")
         workflow.add_edge("generate_extraction_rules", "extract_jobs")
         workflow.add_edge("extract_jobs", "validate_extraction")
@@ -68,26 +308,11 @@ class JobScrapingWorkflow:
             if state.careers_url:
                 return state
             
-            # Try common patterns
+            # Try common patterns, probing all of them concurrently
             if state.company_domain:
-                common_paths = [
-                    "/careers",
-                    "/jobs",
-                    "/work-with-us",
-                    "/join-us",
-                    "/opportunities"
-                ]
-                
-                for path in common_paths:
-                    potential_url = f"https://{state.company_domain}{path}"
-                    
-                    try:
-                        response = httpx.get(potential_url, timeout=10)
-                        if response.status_code == 200:
-                            state.careers_url = potential_url
-                            break
-                    except:
-                        continue
+                state.careers_url = asyncio.run(
+                    _probe_careers_paths(state.company_domain)
+                )
             
             # If still no URL found, use LLM to help discover
             if not state.careers_url:
@@ -107,23 +332,23 @@ class JobScrapingWorkflow:
                 state.error_message = "No careers URL found"
                 return state
             
-            headers = {
-                "User-Agent": settings.default_user_agent,
-                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-                "Accept-Language": "en-US,en;q=0.5",
-                "Accept-Encoding": "gzip, deflate",
-                "Connection": "keep-alive",
-            }
-            
-            response = httpx.get(
-                state.careers_url,
-                headers=headers,
-                timeout=settings.request_timeout,
-                follow_redirects=True
-            )
+            # Conditional GET: if the page is unchanged since the last
+            # crawl the server answers 304 with no body at all
+            headers = {}
+            if state.etag:
+                headers['If-None-Match'] = state.etag
+            if state.last_modified:
+                headers['If-Modified-Since'] = state.last_modified
+
+            response = self.http.get(state.careers_url, headers=headers)
+            if response.status_code == 304:
+                state.step = "not_modified"
+                return state
             response.raise_for_status()
             
             state.html_content = response.text
+            state.etag = response.headers.get('etag')
+            state.last_modified = response.headers.get('last-modified')
             state.step = "fetch_complete"
             return state
             
@@ -138,33 +363,18 @@ class JobScrapingWorkflow:
                 state.error_message = "No HTML content to analyze"
                 return state
             
-            soup = BeautifulSoup(state.html_content, 'html.parser')
-            
-            # Look for common job listing patterns
-            job_containers = []
+            soup = self._get_soup(state.html_content)
             
-            # Common selectors for job listings
-            selectors = [
-                "[class*='job']",
-                "[class*='position']",
-                "[class*='opening']",
-                "[data-testid*='job']",
-                ".career-listing",
-                ".job-listing",
-                ".position-listing"
-            ]
-            
-            for selector in selectors:
-                elements = soup.select(selector)
-                if elements:
-                    job_containers.extend(elements)
+            # Look for common job listing patterns with one traversal
+            # over the precompiled selector union
+            job_containers = _JOB_CONTAINER_SELECTOR.select(soup)
             
             # Store analysis results
             state.extraction_rules = {
                 "potential_job_containers": len(job_containers),
                 "page_structure": {
-                    "has_pagination": bool(soup.find(text=re.compile(r'next|more|page', re.I))),
-                    "has_filters": bool(soup.select("[class*='filter'], [class*='search']")),
+                    "has_pagination": bool(soup.find(text=_PAGINATION_RE)),
+                    "has_filters": bool(_FILTER_SELECTOR.select(soup, limit=1)),
                     "total_links": len(soup.find_all('a'))
                 }
             }
@@ -179,65 +389,36 @@ class JobScrapingWorkflow:
     def generate_extraction_rules(self, state: CrawlState) -> CrawlState:
         """Use LLM to generate CSS/XPath selectors for job extraction."""
         try:
-            # Prepare a clean sample of the HTML for the LLM
-            soup = BeautifulSoup(state.html_content, 'html.parser')
-            
-            # Remove script and style elements
-            for script in soup(["script", "style"]):
-                script.decompose()
-            
-            # Get a manageable sample of the HTML
-            html_sample = str(soup)[:8000]  # Limit to avoid token limits
-            
-            prompt = ChatPromptTemplate.from_template("""
-            You are an expert web scraper. Analyze the following HTML from a company careers page and generate CSS selectors to extract job listings.
-
-            Company: {company_name}
-            URL: {careers_url}
-
-            HTML Sample:
-            {html_sample}
-
-            Please provide a JSON response with the following structure:
-            {{
-                "job_list_selector": "CSS selector for the container holding all jobs",
-                "job_item_selector": "CSS selector for individual job items",
-                "title_selector": "CSS selector for job title (relative to job item)",
-                "location_selector": "CSS selector for job location (relative to job item)",
-                "department_selector": "CSS selector for department (relative to job item)",
-                "link_selector": "CSS selector for job detail link (relative to job item)",
-                "confidence_score": 0.8,
-                "notes": "Any additional observations"
-            }}
-
-            Focus on finding reliable, specific selectors that uniquely identify job-related elements.
-            """)
+            # Prepare a clean, bounded sample of the HTML for the LLM
+            html_sample = _clean_html_sample(state.html_content)
             
-            response = self.llm.invoke(prompt.format_messages(
+            response = self.llm.invoke(_EXTRACTION_PROMPT.format_messages(
                 company_name=state.company_name,
                 careers_url=state.careers_url,
                 html_sample=html_sample
             ))
             
-            try:
-                # Extract JSON from response
-                content = response.content
-                json_match = re.search(r'\{.*\}', content, re.DOTALL)
-                if json_match:
-                    rules = json.loads(json_match.group())
-                    state.extraction_rules = rules
-                    state.confidence_score = rules.get('confidence_score', 0.5)
-            except json.JSONDecodeError:
-                state.error_message = "Failed to parse LLM response as JSON"
-                return state
-            
-            state.step = "rules_generated"
-            return state
+            return self._apply_extraction_rules(state, response.content)
             
         except Exception as e:
             state.error_message = f"Rule generation failed: {str(e)}"
             return state
     
+    def _apply_extraction_rules(self, state: CrawlState, content: str) -> CrawlState:
+        """Parse an LLM reply into extraction rules on the state."""
+        blob = _extract_json_object(content)
+        if blob:
+            try:
+                rules = orjson.loads(blob)
+            except orjson.JSONDecodeError:
+                state.error_message = "Failed to parse LLM response as JSON"
+                return state
+            state.extraction_rules = rules
+            state.confidence_score = rules.get('confidence_score', 0.5)
+        
+        state.step = "rules_generated"
+        return state
+    
     def extract_jobs(self, state: CrawlState) -> CrawlState:
         """Extract job listings using the generated rules."""
         try:
@@ -245,41 +426,57 @@ class JobScrapingWorkflow:
                 state.error_message = "Missing extraction rules or content"
                 return state
             
-            soup = BeautifulSoup(state.html_content, 'html.parser')
+            soup = self._get_soup(state.html_content)
             rules = state.extraction_rules
             
             jobs = []
             
             # Find job containers
             if 'job_item_selector' in rules:
+                # Compile the relative field selectors once per crawl so
+                # the per-element lookups skip selector-string parsing
+                compiled = {
+                    key: soupsieve.compile(rules[key])
+                    for key in (
+                        'title_selector',
+                        'location_selector',
+                        'department_selector',
+                        'link_selector'
+                    )
+                    if rules.get(key)
+                }
+
+                def select_first(element, key):
+                    selector = compiled.get(key)
+                    if selector is None:
+                        return None
+                    matches = selector.select(element, limit=1)
+                    return matches[0] if matches else None
+
                 job_elements = soup.select(rules['job_item_selector'])
                 
                 for job_element in job_elements:
                     job_data = {}
                     
                     # Extract title
-                    if 'title_selector' in rules:
-                        title_elem = job_element.select_one(rules['title_selector'])
-                        if title_elem:
-                            job_data['title'] = title_elem.get_text(strip=True)
+                    title_elem = select_first(job_element, 'title_selector')
+                    if title_elem:
+                        job_data['title'] = title_elem.get_text(strip=True)
                     
                     # Extract location
-                    if 'location_selector' in rules:
-                        location_elem = job_element.select_one(rules['location_selector'])
-                        if location_elem:
-                            job_data['location'] = location_elem.get_text(strip=True)
+                    location_elem = select_first(job_element, 'location_selector')
+                    if location_elem:
+                        job_data['location'] = location_elem.get_text(strip=True)
                     
                     # Extract department
-                    if 'department_selector' in rules:
-                        dept_elem = job_element.select_one(rules['department_selector'])
-                        if dept_elem:
-                            job_data['department'] = dept_elem.get_text(strip=True)
+                    dept_elem = select_first(job_element, 'department_selector')
+                    if dept_elem:
+                        job_data['department'] = dept_elem.get_text(strip=True)
                     
                     # Extract link
-                    if 'link_selector' in rules:
-                        link_elem = job_element.select_one(rules['link_selector'])
-                        if link_elem and link_elem.get('href'):
-                            job_data['url'] = urljoin(state.careers_url, link_elem['href'])
+                    link_elem = select_first(job_element, 'link_selector')
+                    if link_elem and link_elem.get('href'):
+                        job_data['url'] = urljoin(state.careers_url, link_elem['href'])
                     
                     if job_data.get('title'):  # Only add if we found a title
                         jobs.append(job_data)
@@ -294,6 +491,9 @@ class JobScrapingWorkflow:
     
     def validate_extraction(self, state: CrawlState) -> CrawlState:
         """Validate the extracted job data and adjust confidence score."""
+        # The parse tree is no longer needed past this node
+        self._soup = None
+        self._soup_html = None
         try:
             jobs = state.job_listings
             
@@ -302,10 +502,17 @@ class JobScrapingWorkflow:
                 state.error_message = "No jobs extracted"
                 return state
             
-            # Calculate quality metrics
-            has_title = sum(1 for job in jobs if job.get('title'))
-            has_location = sum(1 for job in jobs if job.get('location'))
-            has_url = sum(1 for job in jobs if job.get('url'))
+            # Calculate quality metrics and filter in a single pass
+            has_title = has_location = has_url = 0
+            kept = []
+            for job in jobs:
+                titled = bool(job.get('title'))
+                has_title += titled
+                has_location += bool(job.get('location'))
+                has_url += bool(job.get('url'))
+                # Jobs with no title are likely false positives
+                if titled:
+                    kept.append(job)
             
             total_jobs = len(jobs)
             
@@ -318,8 +525,7 @@ class JobScrapingWorkflow:
             
             state.confidence_score = min(state.confidence_score * quality_score, 1.0)
             
-            # Filter out jobs with no title (likely false positives)
-            state.job_listings = [job for job in jobs if job.get('title')]
+            state.job_listings = kept
             
             state.step = "validation_complete"
             return state
@@ -330,16 +536,8 @@ class JobScrapingWorkflow:
     
     def _llm_discover_careers_url(self, state: CrawlState) -> CrawlState:
         """Use LLM to help discover careers page URL."""
-        prompt = ChatPromptTemplate.from_template("""
-        Given the company name "{company_name}" and domain "{company_domain}", 
-        what are the most likely URLs for their careers page?
-        
-        Provide 3-5 potential URLs in order of likelihood.
-        Format as a simple list, one URL per line.
-        """)
-        
         try:
-            response = self.llm.invoke(prompt.format_messages(
+            response = self.llm.invoke(_DISCOVERY_PROMPT.format_messages(
                 company_name=state.company_name,
                 company_domain=state.company_domain or "unknown"
             ))
@@ -349,7 +547,7 @@ class JobScrapingWorkflow:
             
             for url in urls[:3]:  # Test top 3 suggestions
                 try:
-                    test_response = httpx.head(url, timeout=5)
+                    test_response = self.http.head(url, timeout=5)
                     if test_response.status_code == 200:
                         state.careers_url = url
                         break
@@ -361,13 +559,83 @@ class JobScrapingWorkflow:
         
         return state
     
-    def run_crawl(self, company_name: str, company_domain: str = None, careers_url: str = None) -> CrawlState:
+    def _prepare_crawl(self, company: Dict[str, Any]) -> CrawlState:
+        """Blocking discover+fetch for one company; run in a worker thread."""
+        state = CrawlState(
+            company_name=company['name'],
+            company_domain=company.get('domain'),
+            careers_url=company.get('careers_url'),
+            etag=company.get('etag'),
+            last_modified=company.get('last_modified')
+        )
+        state = self.discover_careers_page(state)
+        return self.fetch_content(state)
+
+    def run_batch(self, companies: List[Dict[str, Any]]) -> List[CrawlState]:
+        """
+        Crawl several companies with one batched LLM round-trip.
+
+        The discover/fetch stages run concurrently across companies, then
+        every rule-generation prompt is sent in a single abatch call so
+        the OpenAI round-trips overlap instead of serializing, and the
+        post-LLM stages finish each state.
+        """
+        # Overlap the blocking discover/fetch network waits by running
+        # each company's pre-LLM stages in a worker thread; the shared
+        # httpx client is thread-safe and multiplexes the connections
+        async def _prepare_all():
+            return await asyncio.gather(
+                *[
+                    asyncio.to_thread(self._prepare_crawl, company)
+                    for company in companies
+                ]
+            )
+
+        states = list(asyncio.run(_prepare_all()))
+
+        # One batched LLM call for every crawl that produced content;
+        # the prompt sample streams straight off the raw HTML, so no
+        # parse tree is needed before the LLM round-trip
+        pending = [s for s in states if s.html_content and not s.error_message]
+        if pending:
+            prompts = [
+                _EXTRACTION_PROMPT.format_messages(
+                    company_name=s.company_name,
+                    careers_url=s.careers_url,
+                    html_sample=_clean_html_sample(s.html_content)
+                )
+                for s in pending
+            ]
+            try:
+                responses = asyncio.run(self.llm.abatch(prompts))
+            except Exception as e:
+                for s in pending:
+                    s.error_message = f"Rule generation failed: {str(e)}"
+            else:
+                # Finish each state's post-LLM stages contiguously so the
+                # single-slot parse-tree cache serves analyze and extract
+                # with one parse per page, as on the graph path
+                for s, response in zip(pending, responses):
+                    self.analyze_structure(s)
+                    self._apply_extraction_rules(s, response.content)
+                    if not s.error_message:
+                        self.extract_jobs(s)
+                        self.validate_extraction(s)
+
+        return states
+
+    def run_crawl(self, company_name: str, company_domain: str = None, careers_url: str = None,
+                  etag: str = None, last_modified: str = None) -> CrawlState:
         """Run the complete crawling workflow."""
         initial_state = CrawlState(
             company_name=company_name,
             company_domain=company_domain,
-            careers_url=careers_url
+            careers_url=careers_url,
+            etag=etag,
+            last_modified=last_modified
         )
         
+        # LangGraph returns the channel values as a plain dict; the keys
+        # match the dataclass fields, so rebuild the state for callers
         result = self.graph.invoke(initial_state)
-        return result
\ No newline at end of file
+        return CrawlState(**result)
\ No newline at end of file